@@ -6,15 +6,42 @@ Bitbucket Line Comments - Post inline comments from diff files
 import argparse
 import sys
 import base64
-import re
-from typing import List, Dict, Optional
+import errno
+import io
+import itertools
+import json
+import mmap
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import os
 
+try:
+    from orjson import dumps as json_dumps
+except ImportError:
+    # orjson is optional; fall back to the standard library encoder
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
 # Load environment variables
 load_dotenv()
 
+# Upper bound on comments posted to Bitbucket at the same time
+MAX_CONCURRENT_POSTS = 8
+
+# Upper bound on diff files read at the same time
+MAX_PARSE_WORKERS = 16
+
+# Number of leading diff lines quoted in each comment
+SNIPPET_LINES = 8
+
+# Diff files at least this large are memory-mapped instead of read
+MMAP_THRESHOLD = 64 * 1024
+
 
 class BitbucketClient:
     """Client for interacting with Bitbucket REST API v1"""
@@ -38,14 +65,34 @@ class BitbucketClient:
         self.headers = {
             'Authorization': f'Basic {encoded_credentials}',
             'Content-Type': 'application/json',
-            'Accept': 'application/json'
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate'
         }
+        
+        # Pull requests endpoint, built once and reused for every comment
+        self._pullrequests_url = f"{self.server}/repositories/{self.workspace}/{self.repo}/pullrequests"
+        
+        # Persistent session so comments reuse the same keep-alive connection
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retries = Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retries))
+    
+    def close(self):
+        """Close the underlying HTTP session"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def test_connection(self) -> bool:
         """Test connection to Bitbucket (using API v1)"""
         try:
             url = f"{self.server}/user"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, timeout=(3, 5))
             response.raise_for_status()
             user_info = response.json()
             print(f"✓ Connected to Bitbucket as: {user_info.get('display_name', self.username)}")
@@ -74,7 +121,7 @@ class BitbucketClient:
             bool: True if successful, False otherwise
         """
         try:
-            url = f"{self.server}/repositories/{self.workspace}/{self.repo}/pullrequests/{pr_id}/comments"
+            url = f"{self._pullrequests_url}/{pr_id}/comments"
             
             # v1 API format
             payload = {
@@ -83,10 +130,9 @@ class BitbucketClient:
                 "filename": file_path
             }
             
-            response = requests.post(
+            response = self.session.post(
                 url,
-                headers=self.headers,
-                json=payload,
+                data=json_dumps(payload),
                 timeout=30
             )
             
@@ -101,48 +147,127 @@ class BitbucketClient:
             return False
 
 
-def parse_diff_file(file_path: str) -> Optional[Dict]:
+def split_leading_lines(data, max_lines: int) -> List[str]:
+    """
+    Decode the first lines of a UTF-8 buffer.
+    
+    Args:
+        data: bytes or mmap holding the start of the file
+        max_lines: Maximum number of lines to return
+        
+    Returns:
+        list: Up to max_lines lines with universal newlines translated
+    """
+    end = 0
+    for _ in range(max_lines):
+        newline = data.find(b'\n', end)
+        if newline == -1:
+            end = len(data)
+            break
+        end = newline + 1
+    text = data[:end].decode('utf-8')
+    
+    return list(itertools.islice(io.StringIO(text, newline=None), max_lines))
+
+
+def read_leading_lines(file_path: str, max_lines: int) -> List[str]:
+    """
+    Read the first lines of a UTF-8 text file.
+    
+    Regular files smaller than MMAP_THRESHOLD are fetched with a single
+    unbuffered read; larger ones are memory-mapped so only the prefix up to
+    the last needed newline is touched and decoded. Pipes, devices and files
+    that cannot be mapped (e.g. on some FUSE mounts) are read in
+    MMAP_THRESHOLD-sized chunks until enough lines are available.
+    
+    Args:
+        file_path: Path to the file
+        max_lines: Maximum number of lines to return
+        
+    Returns:
+        list: Up to max_lines lines with universal newlines translated
+    """
+    with open(file_path, 'rb', buffering=0) as f:
+        file_stat = os.fstat(f.fileno())
+        if stat.S_ISREG(file_stat.st_mode):
+            if file_stat.st_size < MMAP_THRESHOLD:
+                return split_leading_lines(f.read(MMAP_THRESHOLD), max_lines)
+            
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                mm = None
+            
+            if mm is not None:
+                with mm:
+                    return split_leading_lines(mm, max_lines)
+        
+        # Pipes report no usable size and one read only returns what is
+        # buffered so far, so keep reading until enough lines arrive
+        data = bytearray()
+        newlines = 0
+        while newlines < max_lines:
+            chunk = f.read(MMAP_THRESHOLD)
+            if not chunk:
+                break
+            data += chunk
+            newlines += chunk.count(b'\n')
+        return split_leading_lines(data, max_lines)
+
+
+def parse_diff_file(file_path: str, max_lines: int = SNIPPET_LINES) -> Optional[Dict]:
     """
     Parse a diff file path to extract filename, range, and content.
     
+    Only the first max_lines lines are read, since that is all the comment
+    snippet uses.
+    
     Args:
         file_path: Full path to the diff file
+        max_lines: Number of leading lines of the diff to keep as content
         
     Returns:
         dict: Dictionary containing filename, range, lines, and content
     """
-    if not os.path.exists(file_path):
-        print(f"✗ Diff file not found: {file_path}")
-        return None
-    
     # Extract filename from path
     filename = os.path.basename(file_path)
     
     # Remove .diff extension
-    base_filename = filename.replace('.diff', '')
+    base_filename = filename[:-5] if filename.endswith('.diff') else filename
     
-    # Extract range using regex pattern: filename.range.diff
-    range_pattern = r'\.(\d+-\d+)\.diff$'
-    range_match = re.search(range_pattern, filename)
+    # Extract range from pattern: filename.range.diff
+    range_str = None
+    if filename.endswith('.diff'):
+        range_base, sep, candidate = base_filename.rpartition('.')
+        start, dash, end = candidate.partition('-')
+        if sep and dash and start.isdecimal() and end.isdecimal():
+            range_str = candidate
     
-    # Read file content
+    # Read the leading lines of the file
     content = ""
+    has_file_header = False
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except (FileNotFoundError, PermissionError, UnicodeDecodeError) as e:
+        lines = read_leading_lines(file_path, max_lines)
+        content = ''.join(lines)
+        has_file_header = any(line.startswith('+++') for line in lines)
+    except (FileNotFoundError, NotADirectoryError):
+        print(f"✗ Diff file not found: {file_path}")
+        return None
+    except (OSError, UnicodeDecodeError) as e:
+        if getattr(e, 'errno', None) == errno.ENAMETOOLONG:
+            print(f"✗ Diff file not found: {file_path}")
+            return None
         content = f"Error reading file: {e}"
     
-    if range_match:
-        range_str = range_match.group(1)
-        start_line, end_line = map(int, range_str.split('-'))
+    if range_str:
         return {
-            'filename': base_filename.replace(f'.{range_str}', ''),
+            'filename': range_base,
             'range': range_str,
-            'start_line': start_line,
-            'end_line': end_line,
+            'start_line': int(start),
+            'end_line': int(end),
             'full_path': file_path,
-            'content': content
+            'content': content,
+            'has_file_header': has_file_header
         }
     else:
         # If no range pattern found, return basic info
@@ -152,35 +277,30 @@ def parse_diff_file(file_path: str) -> Optional[Dict]:
             'start_line': None,
             'end_line': None,
             'full_path': file_path,
-            'content': content
+            'content': content,
+            'has_file_header': has_file_header
         }
 
 
-def parse_diff_files(comma_separated_paths: str) -> List[Dict]:
+def iter_parse_diff_files(comma_separated_paths: str) -> Iterator[Dict]:
     """
-    Parse comma-separated diff file paths.
+    Parse comma-separated diff file paths, yielding each result as soon as
+    it is ready so callers can start working before all files are read.
     
     Args:
         comma_separated_paths: Comma-separated list of diff file paths
         
-    Returns:
-        list: List of parsed diff file information
+    Yields:
+        dict: Parsed diff file information, in input order
     """
-    # Split by comma and strip whitespace
-    file_paths = [path.strip() for path in comma_separated_paths.split(',')]
+    # Split by comma, strip whitespace and skip empty entries
+    file_paths = (path.strip() for path in comma_separated_paths.split(',') if path.strip())
     
-    results = []
-    
-    # Process each file path
-    for file_path in file_paths:
-        if not file_path:
-            continue
-            
-        parsed_info = parse_diff_file(file_path)
-        if parsed_info:
-            results.append(parsed_info)
-    
-    return results
+    # Read files in parallel so their IO overlaps; map() keeps input order
+    with ThreadPoolExecutor(max_workers=MAX_PARSE_WORKERS) as executor:
+        for parsed_info in executor.map(parse_diff_file, file_paths):
+            if parsed_info:
+                yield parsed_info
 
 
 def format_comment(comment: str, filename: str, line: Optional[int]) -> str:
@@ -231,6 +351,15 @@ Examples:
     
     args = parser.parse_args()
     
+    # Parse the first diff file before any client or network setup so a run
+    # without valid diffs fails fast; the rest keep parsing while posting
+    if not args.test:
+        diff_iter = iter_parse_diff_files(args.diff_files)
+        first_diff = next(diff_iter, None)
+        if first_diff is None:
+            print("✗ No valid diff files found")
+            sys.exit(1)
+    
     # Initialize Bitbucket client
     try:
         bb_client = BitbucketClient()
@@ -238,60 +367,60 @@ Examples:
         print(f"✗ {str(e)}")
         sys.exit(1)
     
-    # Test connection if requested
-    if args.test:
-        success = bb_client.test_connection()
-        sys.exit(0 if success else 1)
-    
-    # Parse diff files
-    diff_data = parse_diff_files(args.diff_files)
-    
-    if not diff_data:
-        print("✗ No valid diff files found")
-        sys.exit(1)
-    
-    # Default comment
-    default_comment = args.comment or "Code review finding"
-    
-    # Post comment for each diff file
-    success_count = 0
-    for diff in diff_data:
-        comment_text = format_comment(
-            default_comment,
-            diff['filename'],
-            diff['start_line'] if diff['range'] else None
-        )
+    with bb_client:
+        # Test connection if requested
+        if args.test:
+            success = bb_client.test_connection()
+            sys.exit(0 if success else 1)
         
-        # Extract a snippet from diff content for the comment
-        if diff['content'] and '+++' in diff['content']:
-            # Extract first few lines of diff as context
-            diff_lines = diff['content'].split('\n')[:8]
-            snippet = '\n'.join(diff_lines)
-            comment_text = f"{comment_text}\n\n```\n{snippet}\n```"
+        # Default comment
+        default_comment = args.comment or "Code review finding"
         
-        line_number = diff['start_line'] if diff['range'] else 1
-        
-        print(f"Posting comment to PR #{args.pr} for {diff['filename']} at line {line_number}...")
-        
-        success = bb_client.post_inline_comment(
-            args.pr,
-            diff['filename'],
-            line_number,
-            comment_text
-        )
+        # Post each comment as soon as its diff file is parsed; posts run
+        # concurrently and share the session's connection pool
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_POSTS) as executor:
+            pending = []
+            for diff in itertools.chain([first_diff], diff_iter):
+                comment_text = format_comment(
+                    default_comment,
+                    diff['filename'],
+                    diff['start_line'] if diff['range'] else None
+                )
+                
+                # Extract a snippet from diff content for the comment
+                if diff['has_file_header']:
+                    # Extract first few lines of diff as context
+                    diff_lines = diff['content'].split('\n', SNIPPET_LINES)[:SNIPPET_LINES]
+                    snippet = '\n'.join(diff_lines)
+                    comment_text = f"{comment_text}\n\n```\n{snippet}\n```"
+                
+                line_number = diff['start_line'] if diff['range'] else 1
+                
+                print(f"Posting comment to PR #{args.pr} for {diff['filename']} at line {line_number}...")
+                
+                future = executor.submit(
+                    bb_client.post_inline_comment,
+                    args.pr,
+                    diff['filename'],
+                    line_number,
+                    comment_text
+                )
+                pending.append((diff['filename'], future))
+            
+            success_count = 0
+            for filename, future in pending:
+                if future.result():
+                    print(f"✓ Comment posted successfully for {filename}")
+                    success_count += 1
+                else:
+                    print(f"✗ Failed to post comment for {filename}")
         
-        if success:
-            print(f"✓ Comment posted successfully for {diff['filename']}")
-            success_count += 1
+        if success_count == len(pending):
+            print(f"\n✓ Posted all {success_count} comments successfully")
+            sys.exit(0)
         else:
-            print(f"✗ Failed to post comment for {diff['filename']}")
-    
-    if success_count == len(diff_data):
-        print(f"\n✓ Posted all {success_count} comments successfully")
-        sys.exit(0)
-    else:
-        print(f"\n✗ Posted {success_count}/{len(diff_data)} comments")
-        sys.exit(1)
+            print(f"\n✗ Posted {success_count}/{len(pending)} comments")
+            sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -7,7 +7,6 @@ Usage: python3 parse-diff-files.py <comma_separated_diff_files>
 
 import sys
 import os
-import re
 
 def parse_diff_file_path(file_path):
     """
@@ -23,12 +22,16 @@ def parse_diff_file_path(file_path):
     filename = os.path.basename(file_path)
     
     # Remove .diff extension
-    base_filename = filename.replace('.diff', '')
+    base_filename = filename[:-5] if filename.endswith('.diff') else filename
     
-    # Extract range using regex pattern: filename.range.diff
+    # Extract range from pattern: filename.range.diff
     # Pattern matches: filename.1-292.diff -> range = "1-292"
-    range_pattern = r'\.(\d+-\d+)\.diff$'
-    range_match = re.search(range_pattern, filename)
+    range_str = None
+    if filename.endswith('.diff'):
+        range_base, sep, candidate = base_filename.rpartition('.')
+        start_line, dash, end_line = candidate.partition('-')
+        if sep and dash and start_line.isdecimal() and end_line.isdecimal():
+            range_str = candidate
     
     # Read file content
     content = ""
@@ -38,11 +41,9 @@ def parse_diff_file_path(file_path):
     except (FileNotFoundError, PermissionError, UnicodeDecodeError) as e:
         content = f"Error reading file: {e}"
     
-    if range_match:
-        range_str = range_match.group(1)
-        start_line, end_line = range_str.split('-')
+    if range_str:
         return {
-            'filename': base_filename.replace(f'.{range_str}', ''),
+            'filename': range_base,
             'range': range_str,
             'start_line': int(start_line),
             'end_line': int(end_line),
@@ -70,16 +71,13 @@ def parse_diff_files(input_files):
     Returns:
         list: List of dictionaries containing parsed information for each file
     """
-    # Split by comma and strip whitespace
-    file_paths = [path.strip() for path in input_files.split(',')]
+    # Split by comma, strip whitespace and skip empty entries
+    file_paths = (path.strip() for path in input_files.split(',') if path.strip())
     
     results = []
     
     # Process each file path
     for file_path in file_paths:
-        if not file_path:
-            continue
-            
         parsed_info = parse_diff_file_path(file_path)
         results.append(parsed_info)
     